@@ -1,17 +1,21 @@
-import hashlib
 import re
 
+import xxhash
+from lxml import etree
+from lxml.html import HtmlElement
 
-def normalize_html(html: str) -> str:
-    # Remove script/style to reduce noisy changes
-    html = re.sub(r"<script.*?>.*?</script>", "", html, flags=re.S | re.I)
-    html = re.sub(r"<style.*?>.*?</style>", "", html, flags=re.S | re.I)
+_WS_RE = re.compile(rb"\s+")
 
-    # Normalize whitespace
-    html = re.sub(r"\s+", " ", html).strip()
-    return html
 
+def normalize_html(root: HtmlElement) -> bytes:
+    # root is the scraper's shared tree, already stripped of script/style/template
+    # so they don't cause noisy changes.
+    # Text-only serialization, then normalize whitespace
+    text = etree.tostring(root, method="text", encoding="utf-8")
+    return _WS_RE.sub(b" ", text).strip()
 
-def hash_content(html: str) -> str:
-    normalized = normalize_html(html)
-    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
\ No newline at end of file
+
+def hash_content(root: HtmlElement) -> str:
+    # Change detection only: a 128-bit non-crypto hash is plenty, and xxh3
+    # is far faster than sha256. Stored as hex, same as before.
+    return xxhash.xxh3_128_hexdigest(normalize_html(root))
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, Integer, String, Text, UniqueConstraint, create_engine
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, UniqueConstraint, create_engine, event
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 Base = declarative_base()
@@ -18,15 +18,54 @@ class ExtractedData(Base):
     content_hash = Column(String, nullable=False)
     data_json = Column(Text, nullable=False)
 
-    __table_args__ = (UniqueConstraint("url", "content_hash", name="uq_url_hash"),)
+    __table_args__ = (
+        UniqueConstraint("url", "content_hash", name="uq_url_hash"),
+        Index("ix_uni_type", "university", "page_type"),
+        # WHERE university=? ORDER BY extracted_at DESC (SQLite walks it backwards)
+        Index("ix_uni_time", "university", "extracted_at"),
+        Index("ix_time", "extracted_at"),
+    )
+
+
+class UrlCacheMeta(Base):
+    # HTTP validators from the last successful fetch, for conditional GETs
+    __tablename__ = "url_cache_meta"
+
+    url = Column(String, primary_key=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    last_hash = Column(String, nullable=True)
+
+
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # readers don't block on scheduler commits
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-64000",  # ~64 MB page cache
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
 
 
 def get_engine(db_url: str):
     # check_same_thread False required for sqlite + background scheduler
-    return create_engine(db_url, future=True, connect_args={"check_same_thread": False})
+    engine = create_engine(db_url, future=True, connect_args={"check_same_thread": False})
+
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _pragmas(dbapi_conn, _):
+            cur = dbapi_conn.cursor()
+            for pragma in _SQLITE_PRAGMAS:
+                cur.execute(pragma)
+            cur.close()
+
+    return engine
 
 
 def get_session_maker(db_url: str):
     engine = get_engine(db_url)
     Base.metadata.create_all(engine)
+    # create_all skips existing tables, so add indexes introduced later
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
     return sessionmaker(bind=engine, autoflush=False, autocommit=False)
\ No newline at end of file
@@ -1,20 +1,36 @@
-import json
-import asyncio
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
 
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.exc import IntegrityError
+from jinja2 import Environment, FileSystemLoader
+import orjson
+from sqlalchemy import func
 
 from app.db import ExtractedData, get_session_maker
-from app.scheduler import run_pipeline
+from app.scheduler import DATA_VERSION, load_validators, mark_data_changed, save_results, store_pipeline_results
 from app.settings import config
-from app.sources import SOURCES
-from app.scraper import scrape_one
+from app.sources import PAGE_TYPES, SOURCES, UNIVERSITIES
+from app.scraper import scrape_many, shutdown_extract_pool
 
-app = FastAPI(title="Ivy League Intelligence Web App")
-templates = Jinja2Templates(directory="app/templates")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await run_in_threadpool(shutdown_extract_pool)
+
+
+app = FastAPI(title="Ivy League Intelligence Web App", lifespan=lifespan)
+# Templates don't change at runtime: skip mtime checks, keep compiled ones cached
+templates = Jinja2Templates(env=Environment(
+    loader=FileSystemLoader("app/templates"),
+    autoescape=True,
+    auto_reload=False,
+    cache_size=400,
+))
 
 SessionLocal = get_session_maker(config.DB_URL)
 
@@ -22,9 +38,23 @@ LAST_RUN = {
     "time": None,
     "saved_new_records": 0,
     "errors": 0,
-    "skipped_duplicates": 0
+    "skipped_duplicates": 0,
+    "not_modified": 0
 }
 
+_SOURCE_COUNT = len(SOURCES)
+
+# Query results, valid until the next committed write in this process
+# (DATA_VERSION) or READ_CACHE_TTL_SEC, whichever comes first; the TTL
+# covers writes from other workers/processes.
+_DASH_CACHE = {"key": None, "at": 0.0, "val": None}
+_LATEST_CACHE = {}  # limit -> (data_version, cached_at, body)
+_LATEST_CACHE_MAX = 32
+
+
+def _fresh(key, cached_key, cached_at: float) -> bool:
+    return cached_key == key and time.monotonic() - cached_at < config.READ_CACHE_TTL_SEC
+
 
 @app.get("/ping")
 def ping():
@@ -32,32 +62,32 @@ def ping():
 
 
 def _latest_per_uni(db):
-    universities = sorted({s["university"] for s in SOURCES})
     meta = {}
 
-    for uni in universities:
-        latest = (
-            db.query(ExtractedData)
-            .filter(ExtractedData.university == uni)
-            .order_by(ExtractedData.extracted_at.desc())
-            .first()
+    latests = dict(
+        db.query(ExtractedData.university, func.max(ExtractedData.extracted_at))
+        .group_by(ExtractedData.university)
+        .all()
+    )
+    type_counts = {
+        (uni, t): n
+        for uni, t, n in (
+            db.query(ExtractedData.university, ExtractedData.page_type, func.count())
+            .group_by(ExtractedData.university, ExtractedData.page_type)
+            .all()
         )
+    }
 
+    for uni in UNIVERSITIES:
+        latest = latests.get(uni)
         last_updated = (
-            latest.extracted_at.isoformat(sep=" ", timespec="seconds")
+            latest.isoformat(sep=" ", timespec="seconds")
             if latest else None
         )
 
         counts = {}
-        for t in ["fees", "admissions", "deadlines", "programs", "aid", "about"]:
-            counts[t] = (
-                db.query(ExtractedData)
-                .filter(
-                    ExtractedData.university == uni,
-                    ExtractedData.page_type == t
-                )
-                .count()
-            )
+        for t in PAGE_TYPES:
+            counts[t] = type_counts.get((uni, t), 0)
 
         meta[uni] = {
             "last_updated": last_updated,
@@ -67,24 +97,35 @@ def _latest_per_uni(db):
     return meta
 
 
-@app.get("/", response_class=HTMLResponse)
-def dashboard(request: Request):
-    universities = sorted({s["university"] for s in SOURCES})
+def _dashboard_data():
+    key = DATA_VERSION["n"]
+    if _fresh(key, _DASH_CACHE["key"], _DASH_CACHE["at"]):
+        return _DASH_CACHE["val"]
+
     db = SessionLocal()
     try:
-        record_count = db.query(ExtractedData).count()
-        meta = _latest_per_uni(db)
+        val = (db.query(ExtractedData).count(), _latest_per_uni(db))
     finally:
         db.close()
 
+    _DASH_CACHE["key"] = key
+    _DASH_CACHE["at"] = time.monotonic()
+    _DASH_CACHE["val"] = val
+    return val
+
+
+@app.get("/", response_class=HTMLResponse)
+def dashboard(request: Request):
+    record_count, meta = _dashboard_data()
+
     return templates.TemplateResponse(
         request=request,
         name="dashboard.html",
         context={
             "request": request,
             "title": "Dashboard • Ivy League Intelligence",
-            "universities": universities,
-            "source_count": len(SOURCES),
+            "universities": UNIVERSITIES,
+            "source_count": _SOURCE_COUNT,
             "record_count": record_count,
             "meta": meta,
             "schedule_minutes": config.SCHEDULE_MINUTES,
@@ -100,7 +141,7 @@ def university_page(name: str, request: Request):
         rows = (
             db.query(ExtractedData)
             .filter(ExtractedData.university == name)
-            .order_by(ExtractedData.extracted_at.desc())
+            .order_by(ExtractedData.extracted_at.desc(), ExtractedData.id.desc())
             .limit(80)
             .all()
         )
@@ -110,7 +151,7 @@ def university_page(name: str, request: Request):
 
         for r in rows:
             try:
-                parsed = json.loads(r.data_json)
+                parsed = orjson.loads(r.data_json)
             except Exception:
                 parsed = {"raw": r.data_json}
 
@@ -125,14 +166,7 @@ def university_page(name: str, request: Request):
             if r.page_type not in latest_by_type:
                 latest_by_type[r.page_type] = item
 
-        snapshot = {
-            "fees": latest_by_type.get("fees"),
-            "admissions": latest_by_type.get("admissions"),
-            "deadlines": latest_by_type.get("deadlines"),
-            "programs": latest_by_type.get("programs"),
-            "aid": latest_by_type.get("aid"),
-            "about": latest_by_type.get("about"),
-        }
+        snapshot = {t: latest_by_type.get(t) for t in PAGE_TYPES}
 
         return templates.TemplateResponse(
             request=request,
@@ -162,12 +196,15 @@ def run_ui(request: Request):
 
 
 @app.get("/run-json")
-def run_json():
-    result = run_pipeline(SessionLocal)
+async def run_json():
+    validators = await run_in_threadpool(load_validators, SessionLocal, [s["url"] for s in SOURCES])
+    results = await scrape_many(SOURCES, validators)
+    result = await run_in_threadpool(store_pipeline_results, SessionLocal, results)
     LAST_RUN["time"] = datetime.utcnow().isoformat()
     LAST_RUN["saved_new_records"] = result.get("saved_new_records", 0)
     LAST_RUN["errors"] = result.get("errors", 0)
     LAST_RUN["skipped_duplicates"] = result.get("skipped_duplicates", 0)
+    LAST_RUN["not_modified"] = result.get("not_modified", 0)
 
     return JSONResponse({
         "message": "Scrape run completed",
@@ -176,83 +213,68 @@ def run_json():
     })
 
 
-@app.get("/run-university/{name}")
-def run_university(name: str):
-    uni_sources = [s for s in SOURCES if s["university"].lower() == name.lower()]
-
-    async def _run():
-        out = []
-        for src in uni_sources:
-            try:
-                out.append(await scrape_one(src))
-            except Exception as e:
-                out.append({
-                    "error": str(e),
-                    "url": src["url"],
-                    "page_type": src["page_type"]
-                })
-        return out
-
-    results = asyncio.run(_run())
-
+def _store_university_results(results):
     db = SessionLocal()
     try:
-        saved = 0
-        errors = 0
-        skipped = 0
-
-        for r in results:
-            if "error" in r:
-                errors += 1
-                continue
-
-            row = ExtractedData(
-                university=r["university"],
-                page_type=r["page_type"],
-                url=r["url"],
-                extracted_at=datetime.utcnow(),
-                content_hash=r["hash"],
-                data_json=r["data_json"]
-            )
-            db.add(row)
-
-            try:
-                db.commit()
-                saved += 1
-            except IntegrityError:
-                db.rollback()
-                skipped += 1
-
-        return {
-            "university": name,
-            "saved_new_records": saved,
-            "errors": errors,
-            "skipped_duplicates": skipped
-        }
+        counts = save_results(db, results)
+        db.commit()
+        mark_data_changed()
+        return counts
     finally:
         db.close()
 
 
+@app.get("/run-university/{name}")
+async def run_university(name: str):
+    uni_sources = [s for s in SOURCES if s["university"].lower() == name.lower()]
+
+    validators = await run_in_threadpool(load_validators, SessionLocal, [s["url"] for s in uni_sources])
+    results = await scrape_many(uni_sources, validators)
+    counts = await run_in_threadpool(_store_university_results, results)
+
+    return {
+        "university": name,
+        "saved_new_records": counts["saved_new_records"],
+        "errors": counts["errors"],
+        "skipped_duplicates": counts["skipped_duplicates"],
+        "not_modified": counts["not_modified"]
+    }
+
+
 @app.get("/api/latest")
 def api_latest(limit: int = 80):
+    key = DATA_VERSION["n"]
+    cached = _LATEST_CACHE.get(limit)
+    if cached and _fresh(key, cached[0], cached[1]):
+        return Response(cached[2], media_type="application/json")
+
+    body = _latest_json(limit)
+    if len(_LATEST_CACHE) >= _LATEST_CACHE_MAX:
+        _LATEST_CACHE.clear()
+    _LATEST_CACHE[limit] = (key, time.monotonic(), body)
+    return Response(body, media_type="application/json")
+
+
+def _latest_json(limit: int) -> bytes:
+    # the encoded body is what gets cached, so a hit skips serialization too
     db = SessionLocal()
     try:
         rows = (
             db.query(ExtractedData)
-            .order_by(ExtractedData.extracted_at.desc())
+            .order_by(ExtractedData.extracted_at.desc(), ExtractedData.id.desc())
             .limit(limit)
             .all()
         )
 
-        return [
+        return orjson.dumps([
             {
                 "university": r.university,
                 "page_type": r.page_type,
                 "url": r.url,
                 "extracted_at": r.extracted_at.isoformat(),
-                "data": json.loads(r.data_json)
+                "data": orjson.loads(r.data_json)
             }
             for r in rows
-        ]
+        ])
     finally:
         db.close()
\ No newline at end of file
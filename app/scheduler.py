@@ -1,81 +1,150 @@
 import asyncio
 from datetime import datetime
+from typing import Dict, Iterable, List
 
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from apscheduler.schedulers.background import BackgroundScheduler
 
-from app.db import ExtractedData
+from app.db import ExtractedData, UrlCacheMeta
 from app.settings import config
-from app.sources import SOURCES
-from app.scraper import scrape_one
+from app.sources import SOURCES, UNIVERSITIES
+from app.scraper import Validators, scrape_many
 
 
-def run_pipeline(SessionLocal):
-    async def _run():
-        out = []
-        for src in SOURCES:
-            try:
-                out.append(await scrape_one(src))
-            except Exception as e:
-                out.append({
-                    "error": str(e),
-                    "url": src["url"],
-                    "university": src.get("university"),
-                    "page_type": src.get("page_type")
-                })
-        return out
-
-    results = asyncio.run(_run())
+# Bumped after every committed write; read-side caches key on it
+DATA_VERSION = {"n": 0}
+
+
+def mark_data_changed():
+    DATA_VERSION["n"] += 1
+
+
+def load_validators(SessionLocal, urls: Iterable[str]) -> Dict[str, Validators]:
+    """
+    Validators for conditional GETs, only for URLs whose last fetched
+    content is still stored. Once cleanup trims that row, the next run
+    does a full fetch so the page gets re-inserted instead of 304ing forever.
+    """
+    db = SessionLocal()
+    try:
+        still_stored = (select(ExtractedData.id)
+                        .where(ExtractedData.url == UrlCacheMeta.url,
+                               ExtractedData.content_hash == UrlCacheMeta.last_hash)
+                        .exists())
+        rows = (db.query(UrlCacheMeta.url, UrlCacheMeta.etag, UrlCacheMeta.last_modified)
+                .filter(UrlCacheMeta.url.in_(set(urls)), still_stored)
+                .all())
+        return {url: (etag, last_modified) for url, etag, last_modified in rows}
+    finally:
+        db.close()
+
+
+def _save_validators(db, fetched: List[Dict]):
+    stmt = sqlite_insert(UrlCacheMeta.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["url"],
+        set_={
+            "etag": stmt.excluded.etag,
+            "last_modified": stmt.excluded.last_modified,
+            "last_hash": stmt.excluded.last_hash
+        }
+    )
+    db.execute(stmt, [
+        {
+            "url": r["url"],
+            "etag": r.get("etag"),
+            "last_modified": r.get("last_modified"),
+            "last_hash": r["hash"]
+        }
+        for r in fetched
+    ])
+
+
+def save_results(db, results: List[Dict]) -> Dict:
+    """
+    Insert scraped results in one statement; (url, hash) pairs already
+    stored are skipped, and HTTP validators are updated for every page
+    that was fetched. Caller commits.
+    """
+    errors = sum(1 for r in results if "error" in r)
+    not_modified = sum(1 for r in results if r.get("not_modified"))
+    fetched = [r for r in results if "error" not in r and not r.get("not_modified")]
+    now = datetime.utcnow()
+    rows = [
+        {
+            "university": r["university"],
+            "page_type": r["page_type"],
+            "url": r["url"],
+            "extracted_at": now,
+            "content_hash": r["hash"],
+            "data_json": r["data_json"]
+        }
+        for r in fetched
+    ]
+
+    saved = 0
+    if rows:
+        seen = set(
+            db.query(ExtractedData.url, ExtractedData.content_hash)
+            .filter(ExtractedData.url.in_({row["url"] for row in rows}))
+            .all()
+        )
+        fresh = []
+        for row in rows:
+            key = (row["url"], row["content_hash"])
+            if key not in seen:
+                seen.add(key)
+                fresh.append(row)
+
+        if fresh:
+            # OR IGNORE still covers a concurrent run inserting the same pair
+            stmt = sqlite_insert(ExtractedData.__table__).on_conflict_do_nothing()
+            saved = db.execute(stmt, fresh).rowcount
 
+        _save_validators(db, fetched)
+
+    return {
+        "saved_new_records": saved,
+        "skipped_duplicates": len(rows) - saved,
+        "not_modified": not_modified,
+        "errors": errors
+    }
+
+
+def store_pipeline_results(SessionLocal, results: List[Dict]) -> Dict:
     db = SessionLocal()
     try:
-        saved = 0
-        skipped_duplicates = 0
-        errors = 0
-
-        for r in results:
-            if "error" in r:
-                errors += 1
-                continue
-
-            row = ExtractedData(
-                university=r["university"],
-                page_type=r["page_type"],
-                url=r["url"],
-                extracted_at=datetime.utcnow(),
-                content_hash=r["hash"],
-                data_json=r["data_json"]
-            )
-            db.add(row)
-
-            try:
-                db.commit()
-                saved += 1
-            except IntegrityError:
-                db.rollback()
-                skipped_duplicates += 1
+        counts = save_results(db, results)
 
         # cleanup (keep last N per uni)
-        for uni in {s["university"] for s in SOURCES}:
-            rows = (db.query(ExtractedData)
-                    .filter(ExtractedData.university == uni)
-                    .order_by(ExtractedData.extracted_at.desc())
-                    .all())
-            if len(rows) > config.MAX_PER_UNI_RECORDS:
-                for old in rows[config.MAX_PER_UNI_RECORDS:]:
-                    db.delete(old)
+        # rows of one batch share extracted_at, so id (insert order) breaks ties
+        for uni in UNIVERSITIES:
+            keep_ids = (select(ExtractedData.id)
+                        .where(ExtractedData.university == uni)
+                        .order_by(ExtractedData.extracted_at.desc(), ExtractedData.id.desc())
+                        .limit(config.MAX_PER_UNI_RECORDS))
+            (db.query(ExtractedData)
+             .filter(ExtractedData.university == uni,
+                     ExtractedData.id.notin_(keep_ids))
+             .delete(synchronize_session=False))
         db.commit()
+        mark_data_changed()
 
         return {
-            "saved_new_records": saved,
-            "skipped_duplicates": skipped_duplicates,
-            "errors": errors,
+            **counts,
             "total_sources": len(SOURCES)
         }
     finally:
         db.close()
 
 
+def run_pipeline(SessionLocal):
+    validators = load_validators(SessionLocal, (s["url"] for s in SOURCES))
+    results = asyncio.run(scrape_many(SOURCES, validators))
+    return store_pipeline_results(SessionLocal, results)
+
+
 def start_scheduler(SessionLocal, minutes: int):
     scheduler = BackgroundScheduler()
     scheduler.add_job(lambda: run_pipeline(SessionLocal),
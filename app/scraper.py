@@ -1,10 +1,20 @@
 import asyncio
-import json
+import multiprocessing
 import re
-from typing import Dict, List, Optional
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
 import httpx
-from bs4 import BeautifulSoup
+import orjson
+from lxml import etree
+from lxml import html as lxml_html
+from lxml.html import HtmlElement
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from app.change_detector import hash_content
@@ -29,31 +39,188 @@ class RateLimiter:
             self._last = asyncio.get_event_loop().time()
 
 
-rate_limiter = RateLimiter(config.REQUEST_DELAY_SEC)
+class HostRateLimiter:
+    # one RateLimiter per host: stay polite per domain while other hosts proceed
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._limiters: Dict[str, RateLimiter] = {}
 
+    async def wait(self, url: str):
+        host = urlparse(url).netloc
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            limiter = self._limiters[host] = RateLimiter(self.delay)
+        await limiter.wait()
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=8))
-async def fetch(url: str) -> str:
-    await rate_limiter.wait()
-    headers = {"User-Agent": config.USER_AGENT}
 
-    async with httpx.AsyncClient(
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
         timeout=config.REQUEST_TIMEOUT,
-        headers=headers,
+        headers={"User-Agent": config.USER_AGENT},
         follow_redirects=True,
-    ) as client:
-        r = await client.get(url)
-        r.raise_for_status()
-        return r.text
+        http2=True,
+        limits=httpx.Limits(max_connections=config.MAX_CONNECTIONS),
+    )
+
+
+# (etag, last_modified) stored from the previous fetch of a URL
+Validators = Tuple[Optional[str], Optional[str]]
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=8))
+async def fetch(url: str, client: httpx.AsyncClient, limiter: HostRateLimiter,
+                sem: asyncio.Semaphore, validators: Optional[Validators] = None) -> Optional[httpx.Response]:
+    """
+    GET url, conditional on validators when given.
+    Returns None on 304 Not Modified.
+    """
+    # wait out the host's politeness delay before taking a fetch slot, so
+    # slots aren't held idle by tasks queued behind the same host
+    await limiter.wait(url)
+
+    headers = {}
+    if validators:
+        etag, last_modified = validators
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    async with sem:
+        r = await client.get(url, headers=headers)
+    if r.status_code == 304:
+        return None
+    r.raise_for_status()
+    return r
+
+
+_WS_RE = re.compile(r"\s+")
 
 
 def _clean_text(t: str) -> str:
-    t = re.sub(r"\s+", " ", (t or "")).strip()
+    t = _WS_RE.sub(" ", (t or "")).strip()
     return t
 
 
-def _soup(html: str) -> BeautifulSoup:
-    return BeautifulSoup(html, "lxml")
+_HTML_PARSER = lxml_html.HTMLParser(remove_comments=True)
+# in-document charset declaration, looked for in the first KB only
+_DECLARED_CHARSET_RE = re.compile(rb"<meta[^>]+charset|<\?xml[^>]+encoding", re.IGNORECASE)
+
+
+@lru_cache(maxsize=16)
+def _parser_for(encoding: str) -> lxml_html.HTMLParser:
+    return lxml_html.HTMLParser(encoding=encoding, remove_comments=True)
+
+
+def _pick_parser(html: bytes, encoding: Optional[str]) -> lxml_html.HTMLParser:
+    # 1. charset from the Content-Type header, like httpx's r.text
+    if encoding:
+        try:
+            return _parser_for(encoding.lower())
+        except LookupError:  # unknown charset name
+            pass
+    # 2. declared in the document: libxml2 honours it
+    if _DECLARED_CHARSET_RE.search(html, 0, 1024):
+        return _HTML_PARSER
+    # 3. undeclared: UTF-8 (httpx's default), not libxml2's latin-1 guess
+    return _parser_for("utf-8")
+
+
+def _lxml(html: bytes, encoding: Optional[str] = None) -> HtmlElement:
+    parser = _pick_parser(html, encoding)
+    try:
+        root = lxml_html.document_fromstring(html, parser=parser)
+    except etree.ParserError:  # empty document
+        return lxml_html.Element("html")
+
+    etree.strip_elements(root, "script", "style", "template", with_tail=False)
+    return root
+
+
+def _text(el: HtmlElement) -> str:
+    return " ".join(el.itertext())
+
+
+def _keywords(words: List[str]) -> re.Pattern:
+    # One alternation scan instead of `any(k in low for k in words)`
+    return re.compile("|".join(re.escape(w) for w in words))
+
+
+# ---------------------------
+# DOM features (one walk per page)
+# ---------------------------
+@dataclass
+class DomFeatures:
+    text: List[str] = field(default_factory=list)  # raw text nodes, document order
+    tables: List[List[List[str]]] = field(default_factory=list)
+    headings: List[str] = field(default_factory=list)
+    bullets: List[str] = field(default_factory=list)
+    links: List[str] = field(default_factory=list)
+    paragraphs: List[str] = field(default_factory=list)
+
+
+_FEATURE_TAGS = {
+    "tables": ("table",),
+    "headings": ("h1", "h2", "h3"),
+    "bullets": ("li",),
+    "links": ("a",),
+    "paragraphs": ("p",),
+}
+
+# features each extractor reads; anything else is skipped during the walk
+_PAGE_FEATURES = {
+    "fees": ("text", "tables"),
+    "admissions": ("headings", "bullets"),
+    "deadlines": ("text",),
+    "programs": ("links", "bullets"),
+    "aid": ("paragraphs",),
+    "about": ("paragraphs",),
+}
+
+
+def _table_rows(table: HtmlElement, max_rows: int = 25) -> List[List[str]]:
+    """
+    Return table as list of rows, row is list of cell texts.
+    """
+    rows_out = []
+    for tr in islice(table.iter("tr"), max_rows):
+        row = [_clean_text(_text(c)) for c in tr.iter("th", "td")]
+        row = [c for c in row if c]
+        if row:
+            rows_out.append(row)
+    return rows_out
+
+
+def _collect(root: HtmlElement, kinds: Tuple[str, ...], max_tables: int = 3) -> DomFeatures:
+    feats = DomFeatures()
+    if "text" in kinds:
+        feats.text = list(root.itertext())
+
+    tags = [t for k in kinds for t in _FEATURE_TAGS.get(k, ())]
+    if not tags:
+        return feats
+
+    tables_seen = 0
+    for el in root.iter(*tags):
+        tag = el.tag
+        if tag == "table":
+            if tables_seen < max_tables:
+                tables_seen += 1
+                rows = _table_rows(el)
+                if rows:
+                    feats.tables.append(rows)
+            continue
+
+        t = _clean_text(_text(el))
+        if tag == "li":
+            feats.bullets.append(t)
+        elif tag == "a":
+            feats.links.append(t)
+        elif tag == "p":
+            feats.paragraphs.append(t)
+        else:
+            feats.headings.append(t)
+    return feats
 
 
 # ---------------------------
@@ -61,46 +228,40 @@ def _soup(html: str) -> BeautifulSoup:
 # ---------------------------
 _MONEY = re.compile(r"\$?\s*([0-9]{1,3}(?:,[0-9]{3})+|[0-9]+)\b")
 
-
-def _extract_tables(soup: BeautifulSoup, max_tables: int = 3, max_rows: int = 25) -> List[List[List[str]]]:
-    """
-    Return list of tables, each table is list of rows, row is list of cell texts.
-    """
-    tables_out = []
-    tables = soup.select("table")[:max_tables]
-    for table in tables:
-        rows_out = []
-        for tr in table.select("tr")[:max_rows]:
-            cells = tr.find_all(["th", "td"])
-            row = [_clean_text(c.get_text(" ")) for c in cells]
-            row = [c for c in row if c]
-            if row:
-                rows_out.append(row)
-        if rows_out:
-            tables_out.append(rows_out)
-    return tables_out
-
-
-def extract_fees(html: str) -> Dict:
-    soup = _soup(html)
-    text = _clean_text(soup.get_text(" "))
+# label -> summary bucket, in output order
+_FEE_LABELS = {
+    "tuition": "tuition",
+    "fees": "fees",
+    "housing": "housing", "room": "housing",
+    "food": "food", "board": "food", "meal": "food",
+    "books": "books",
+    "travel": "travel", "transportation": "travel",
+    "personal": "personal",
+}
+# Amount is a lookahead so a match only consumes its label: "Tuition and
+# fees $X" yields $X for both buckets.
+_FEES_RE = re.compile(
+    rf"(?P<label>{'|'.join(_FEE_LABELS)})(?=[^$]{{0,80}}\$\s*(?P<amount>[0-9][0-9,]*))",
+    re.IGNORECASE | re.ASCII,  # ASCII folding only, so label.lower() is always a key
+)
+
+
+def extract_fees(feats: DomFeatures) -> Dict:
+    text = _clean_text(" ".join(feats.text))
 
     # Try tables first (more accurate)
-    tables = _extract_tables(soup)
-    key_values = {}
-
-    # Heuristic: search label -> money in full text
-    def find_money(label: str) -> Optional[str]:
-        m = re.search(rf"{label}[^$]*\$\s*([0-9,]+)", text, re.IGNORECASE)
-        return f"${m.group(1)}" if m else None
-
-    key_values["tuition"] = find_money("Tuition")
-    key_values["fees"] = find_money("Fees")
-    key_values["housing"] = find_money("Housing|Room")
-    key_values["food"] = find_money("Food|Board|Meal")
-    key_values["books"] = find_money("Books")
-    key_values["travel"] = find_money("Travel|Transportation")
-    key_values["personal"] = find_money("Personal")
+    tables = feats.tables
+    key_values = dict.fromkeys(_FEE_LABELS.values())
+
+    # Heuristic: first label -> money in full text, per bucket, in one scan
+    missing = len(key_values)
+    for m in _FEES_RE.finditer(text):
+        bucket = _FEE_LABELS[m["label"].lower()]
+        if key_values[bucket] is None:
+            key_values[bucket] = f"${m['amount']}"
+            missing -= 1
+            if not missing:
+                break
 
     # compute rough “total” if many values exist
     total = None
@@ -122,20 +283,21 @@ def extract_fees(html: str) -> Dict:
 # ---------------------------
 # ADMISSIONS extraction
 # ---------------------------
-def extract_admissions(html: str) -> Dict:
-    soup = _soup(html)
+_REQ_KEYWORDS = _keywords(["recommend", "required", "requirement", "years", "transcript", "essay", "teacher", "recommendation", "testing", "sat", "act"])
 
+
+def extract_admissions(feats: DomFeatures) -> Dict:
     # bullets + headings
-    headings = [_clean_text(h.get_text(" ")) for h in soup.select("h1, h2, h3")][:30]
-    bullets = [_clean_text(li.get_text(" ")) for li in soup.select("li")]
+    headings = feats.headings[:30]
+    bullets = feats.bullets
 
     # likely requirement bullets
     reqs = []
     for b in bullets:
-        low = b.lower()
-        if any(k in low for k in ["recommend", "required", "requirement", "years", "transcript", "essay", "teacher", "recommendation", "testing", "sat", "act"]):
-            if 20 <= len(b) <= 220:
-                reqs.append(b)
+        if not 20 <= len(b) <= 220:
+            continue
+        if _REQ_KEYWORDS.search(b.lower()):
+            reqs.append(b)
 
     # de-dup
     uniq = []
@@ -157,30 +319,31 @@ def extract_admissions(html: str) -> Dict:
 # ---------------------------
 _MONTHS = r"(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|jun(?:e)?|jul(?:y)?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
 _DATE_LINE = re.compile(rf"({_MONTHS})\s+(\d{{1,2}})\b", re.IGNORECASE)
+_DEADLINE_KEYWORDS = _keywords(["deadline", "early", "regular", "decision", "single-choice", "financial aid", "questbridge", "due"])
+_MONTH_HINT = _keywords(["nov", "jan", "feb", "mar", "apr", "may", "dec", "oct", "sep", "aug", "jul", "jun"])
 
 
-def extract_deadlines(html: str) -> Dict:
-    soup = _soup(html)
-    text = soup.get_text("\n")
+def extract_deadlines(feats: DomFeatures) -> Dict:
+    text = "\n".join(feats.text)
     lines = [_clean_text(l) for l in text.splitlines()]
     lines = [l for l in lines if l]
 
     # Pick lines that contain common deadline phrases
     candidates = []
     for l in lines:
+        if not 10 <= len(l) <= 240:
+            continue
         low = l.lower()
-        if any(k in low for k in ["deadline", "early", "regular", "decision", "single-choice", "financial aid", "questbridge", "due"]):
-            if 10 <= len(l) <= 240:
-                # prefer lines with dates
-                if _DATE_LINE.search(l) or any(m in low for m in ["nov", "jan", "feb", "mar", "apr", "may", "dec", "oct", "sep", "aug", "jul", "jun"]):
-                    candidates.append(l)
+        if _DEADLINE_KEYWORDS.search(low):
+            # prefer lines with dates
+            if _DATE_LINE.search(l) or _MONTH_HINT.search(low):
+                candidates.append(l)
 
     # Also look for “Nov 1”, “January 2” style lines in the whole page
     date_snips = []
     for l in lines:
-        if _DATE_LINE.search(l):
-            if 10 <= len(l) <= 200:
-                date_snips.append(l)
+        if 10 <= len(l) <= 200 and _DATE_LINE.search(l):
+            date_snips.append(l)
 
     # De-dup
     def dedup(items: List[str], limit: int) -> List[str]:
@@ -216,30 +379,30 @@ def extract_deadlines(html: str) -> Dict:
 # ---------------------------
 # PROGRAMS/MAJORS extraction
 # ---------------------------
-def extract_programs(html: str) -> Dict:
-    soup = _soup(html)
+_NAV_JUNK = _keywords(["apply", "admission", "financial", "contact", "login", "search", "privacy", "cookie", "menu"])
+_PROGRAM_KEYWORDS = _keywords(["studies", "engineering", "science", "mathematics", "history", "economics", "biology", "computer", "physics", "chemistry", "philosophy", "political", "sociology", "psychology", "language", "literature", "art", "music", "anthropology"])
+
 
+def extract_programs(feats: DomFeatures) -> Dict:
     # Usually majors are links or list items; gather link texts
     link_texts = []
-    for a in soup.select("a"):
-        t = _clean_text(a.get_text(" "))
-        if 3 <= len(t) <= 60:
-            # filter obvious nav junk
-            low = t.lower()
-            if any(x in low for x in ["apply", "admission", "financial", "contact", "login", "search", "privacy", "cookie", "menu"]):
-                continue
-            link_texts.append(t)
+    for t in feats.links:
+        if not 3 <= len(t) <= 60:
+            continue
+        # filter obvious nav junk
+        if _NAV_JUNK.search(t.lower()):
+            continue
+        link_texts.append(t)
 
     # Also list item texts
-    li_texts = [_clean_text(li.get_text(" ")) for li in soup.select("li")]
-    li_texts = [t for t in li_texts if 3 <= len(t) <= 80]
+    li_texts = [t for t in feats.bullets if 3 <= len(t) <= 80]
 
     # Merge + filter to “program-like”
     combined = link_texts + li_texts
     programs = []
     for t in combined:
         low = t.lower()
-        if any(k in low for k in ["studies", "engineering", "science", "mathematics", "history", "economics", "biology", "computer", "physics", "chemistry", "philosophy", "political", "sociology", "psychology", "language", "literature", "art", "music", "anthropology"]):
+        if _PROGRAM_KEYWORDS.search(low):
             programs.append(t)
 
     # de-dup, keep top
@@ -262,11 +425,9 @@ def extract_programs(html: str) -> Dict:
 # ---------------------------
 # AID + ABOUT extraction
 # ---------------------------
-def extract_summary_paragraphs(html: str, max_paras: int = 3) -> List[str]:
-    soup = _soup(html)
+def extract_summary_paragraphs(feats: DomFeatures, max_paras: int = 3) -> List[str]:
     paras = []
-    for p in soup.select("p"):
-        t = _clean_text(p.get_text(" "))
+    for t in feats.paragraphs:
         if 60 <= len(t) <= 350:
             paras.append(t)
         if len(paras) >= max_paras:
@@ -274,16 +435,16 @@ def extract_summary_paragraphs(html: str, max_paras: int = 3) -> List[str]:
     return paras
 
 
-def extract_aid(html: str) -> Dict:
-    paras = extract_summary_paragraphs(html, max_paras=4)
+def extract_aid(feats: DomFeatures) -> Dict:
+    paras = extract_summary_paragraphs(feats, max_paras=4)
     return {
         "summary": paras,
         "note": "Financial aid summary extracted from top paragraphs. Use official page for details."
     }
 
 
-def extract_about(html: str) -> Dict:
-    paras = extract_summary_paragraphs(html, max_paras=4)
+def extract_about(feats: DomFeatures) -> Dict:
+    paras = extract_summary_paragraphs(feats, max_paras=4)
     return {
         "overview": paras,
         "note": "About/overview extracted from top paragraphs. Use official page for details."
@@ -293,34 +454,132 @@ def extract_about(html: str) -> Dict:
 # ---------------------------
 # Entry point per source
 # ---------------------------
-def extract_by_type(page_type: str, html: str) -> Dict:
+def extract_by_type(page_type: str, root: HtmlElement) -> Dict:
+    feats = _collect(root, _PAGE_FEATURES.get(page_type, ("text",)))
+
     if page_type == "fees":
-        return extract_fees(html)
+        return extract_fees(feats)
     if page_type == "admissions":
-        return extract_admissions(html)
+        return extract_admissions(feats)
     if page_type == "deadlines":
-        return extract_deadlines(html)
+        return extract_deadlines(feats)
     if page_type == "programs":
-        return extract_programs(html)
+        return extract_programs(feats)
     if page_type == "aid":
-        return extract_aid(html)
+        return extract_aid(feats)
     if page_type == "about":
-        return extract_about(html)
+        return extract_about(feats)
 
     # fallback
-    soup = _soup(html)
-    return {"text_preview": _clean_text(soup.get_text(" "))[:2000]}
+    return {"text_preview": _clean_text(" ".join(feats.text))[:2000]}
 
 
-async def scrape_one(source: Dict) -> Dict:
-    url = source["url"]
-    html = await fetch(url)
-    h = hash_content(html)
-    data = extract_by_type(source["page_type"], html)
+def process_page(source: Dict, html: bytes, encoding: Optional[str] = None) -> Dict:
+    # parse once; the same tree feeds change detection and extraction
+    root = _lxml(html, encoding)
+    h = hash_content(root)
+    data = extract_by_type(source["page_type"], root)
     return {
         "university": source["university"],
         "page_type": source["page_type"],
-        "url": url,
+        "url": source["url"],
         "hash": h,
-        "data_json": json.dumps(data, ensure_ascii=False),
-    }
\ No newline at end of file
+        "data_json": orjson.dumps(data).decode("utf-8"),  # UTF-8, like ensure_ascii=False
+    }
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()  # scheduler thread and server loop share the pool
+
+
+def _extract_pool() -> ProcessPoolExecutor:
+    # Parsing/extraction is CPU-bound, so run it outside the GIL.
+    # spawn, since the pool may start from a thread (scheduler, threadpool)
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=config.EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _drop_pool(broken: ProcessPoolExecutor):
+    # A dead worker breaks the executor for good; forget it so the next
+    # call builds a fresh one. Concurrent callers only drop it once.
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_extract_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+async def _run_extract(source: Dict, html: bytes, encoding: Optional[str]) -> Dict:
+    loop = asyncio.get_running_loop()
+    pool = _extract_pool()
+    try:
+        return await loop.run_in_executor(pool, process_page, source, html, encoding)
+    except BrokenProcessPool:
+        _drop_pool(pool)
+        # retry once on a fresh pool; if this page is what kills workers it fails again
+        return await loop.run_in_executor(_extract_pool(), process_page, source, html, encoding)
+
+
+async def scrape_one(source: Dict, client: httpx.AsyncClient, limiter: HostRateLimiter,
+                     sem: asyncio.Semaphore, validators: Optional[Validators] = None) -> Dict:
+    url = source["url"]
+    # the fetch slot covers network I/O only; extraction below runs in the
+    # process pool without holding it
+    r = await fetch(url, client, limiter, sem, validators)
+    if r is None:
+        return {
+            "university": source["university"],
+            "page_type": source["page_type"],
+            "url": url,
+            "not_modified": True,
+        }
+
+    result = await _run_extract(source, r.content, r.charset_encoding)
+    result["etag"] = r.headers.get("etag")
+    result["last_modified"] = r.headers.get("last-modified")
+    return result
+
+
+async def scrape_many(sources: List[Dict], validators: Optional[Dict[str, Validators]] = None) -> List[Dict]:
+    """
+    Scrape sources concurrently over one pooled client.
+    URLs with stored validators are fetched conditionally; a 304 comes back
+    as {"not_modified": True}. Failures are returned in place as {"error": ...} dicts.
+    """
+    validators = validators or {}
+    # Locks bind to the running loop, so limiters live for a single run
+    limiter = HostRateLimiter(config.REQUEST_DELAY_SEC)
+    sem = asyncio.Semaphore(config.MAX_CONCURRENT_FETCHES)
+
+    async with _client() as client:
+        results = await asyncio.gather(
+            *(scrape_one(s, client, limiter, sem, validators.get(s["url"])) for s in sources),
+            return_exceptions=True,
+        )
+
+    out = []
+    for src, r in zip(sources, results):
+        if isinstance(r, BaseException):
+            out.append({
+                "error": str(r),
+                "url": src["url"],
+                "university": src.get("university"),
+                "page_type": src.get("page_type")
+            })
+        else:
+            out.append(r)
+    return out
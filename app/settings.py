@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
@@ -6,9 +8,15 @@ class Config(BaseModel):
 
     USER_AGENT: str = "IvyLeagueScraper/3.0 (student project; respectful crawler)"
     REQUEST_TIMEOUT: int = 25
-    REQUEST_DELAY_SEC: float = 1.0  # polite rate limiting
+    REQUEST_DELAY_SEC: float = 1.0  # polite rate limiting (per host)
+    MAX_CONCURRENT_FETCHES: int = 8
+    MAX_CONNECTIONS: int = 16
 
     MAX_PER_UNI_RECORDS: int = 30
+    EXTRACT_WORKERS: Optional[int] = None  # processes for parsing; None = cpu count
+
+    # Dashboard / API result cache; bounds staleness from writes in other processes
+    READ_CACHE_TTL_SEC: int = 60
 
     # Scheduler
     SCHEDULE_MINUTES: int = 180  # every 3 hours
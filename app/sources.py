@@ -111,4 +111,8 @@ SOURCES = [
      "url": "https://srfs.upenn.edu/financial-aid"},
     {"university": "UPenn", "page_type": "about",
      "url": "https://admissions.upenn.edu/"},
-]
\ No newline at end of file
+]
+
+# Derived once at import; SOURCES is static
+UNIVERSITIES = tuple(sorted({s["university"] for s in SOURCES}))
+PAGE_TYPES = ("fees", "admissions", "deadlines", "programs", "aid", "about")